@@ -1,166 +1,330 @@
 import speech_recognition as sr
-from pydub import AudioSegment as PydubAudioSegment
-from pydub.silence import detect_nonsilent
+import numpy as np
+import lameenc
+import soundfile
 import io
-import tempfile
+import mmap
 from pathlib import Path
 from typing import List, Tuple, Optional
 from datetime import datetime
 import asyncio
 import concurrent.futures
+from concurrent.futures.process import BrokenProcessPool
+import multiprocessing
+import hashlib
+import threading
+from collections import OrderedDict
 
 from .models import AudioSegment
+from .mp3_frames import Mp3FrameIndex, SYNC_SPAN
+from .speech_detection import (
+    to_mono_int16,
+    is_sentence_length,
+    detect_speech_segments,
+    init_worker,
+    load_and_detect
+)
 from .config import (
     SAMPLE_RATE, 
     SILENCE_THRESHOLD, 
-    SENTENCE_MIN_LENGTH, 
-    SENTENCE_MAX_LENGTH,
-    SPEECH_RECOGNITION_LANGUAGE
+    SPEECH_RECOGNITION_LANGUAGE,
+    TRANSCRIPTION_WORKERS,
+    AUDIO_PROCESS_WORKERS,
+    TRANSCRIPTION_CACHE_SIZE,
+    STREAM_BUFFER_SECONDS,
+    STREAM_PRIMER_FRAMES
 )
 
+class StreamState:
+    """Decoder and silence-detection state carried across one audio stream."""
+    
+    def __init__(self):
+        # Undecoded bytes, led by the last few frames already decoded, which
+        # are fed again to warm up the decoder for the next batch
+        self.pending = bytearray()
+        self.primer_frames = 0
+        
+        # Decoded samples not yet emitted as segments
+        self.buffer = np.zeros(STREAM_BUFFER_SECONDS * SAMPLE_RATE, dtype=np.int16)
+        self.length = 0
+        
+        # Running loudness of the whole stream, for the silence threshold
+        self.energy = 0.0
+        self.sample_count = 0
+
 class AudioProcessor:
     def __init__(self):
         self.recognizer = sr.Recognizer()
-        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=2)
+        # Decoding and silence detection hold the GIL, so they get their own
+        # processes; recognition requests and encoding stay on threads
+        self.cpu_pool = self._new_cpu_pool()
+        self.io_pool = concurrent.futures.ThreadPoolExecutor(max_workers=TRANSCRIPTION_WORKERS)
+        # LRU of transcriptions keyed by SHA-256 of the segment PCM
+        self._transcription_cache: OrderedDict[bytes, str] = OrderedDict()
+        self._cache_lock = threading.Lock()
     
-    def _load_audio(self, file_path: Path) -> PydubAudioSegment:
-        """Load MP3 audio file."""
-        return PydubAudioSegment.from_mp3(file_path)
+    _detect_speech_segments = staticmethod(detect_speech_segments)
     
-    def _detect_speech_segments(self, audio: PydubAudioSegment) -> List[Tuple[int, int]]:
-        """Detect non-silent segments in audio."""
-        # Convert to mono and set sample rate
-        audio = audio.set_channels(1).set_frame_rate(SAMPLE_RATE)
-        
-        # Detect non-silent chunks
-        nonsilent_ranges = detect_nonsilent(
-            audio,
-            min_silence_len=SILENCE_THRESHOLD,
-            silence_thresh=audio.dBFS - 16
+    @staticmethod
+    def _new_cpu_pool() -> concurrent.futures.ProcessPoolExecutor:
+        """Start a process pool for decoding and silence detection."""
+        # Workers only import speech_detection, never this module
+        return concurrent.futures.ProcessPoolExecutor(
+            max_workers=AUDIO_PROCESS_WORKERS,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=init_worker
         )
-        
-        return nonsilent_ranges
     
-    def _transcribe_audio_segment(self, audio_data: bytes) -> Optional[str]:
+    async def _load_and_detect(self, file_path: Path) -> List[Tuple[Tuple[int, int], np.ndarray]]:
+        """Run load_and_detect in cpu_pool, replacing the pool if a worker died."""
+        loop = asyncio.get_event_loop()
+        cpu_pool = self.cpu_pool
+        try:
+            return await loop.run_in_executor(cpu_pool, load_and_detect, file_path)
+        except BrokenProcessPool:
+            # A dead worker (e.g. OOM-killed) breaks the whole pool; fail
+            # only this request and give later ones a fresh pool. Requests
+            # that shared the broken pool swap it out just once
+            if self.cpu_pool is cpu_pool:
+                self.cpu_pool = self._new_cpu_pool()
+                cpu_pool.shutdown(wait=False)
+            raise
+    
+    def _transcribe_audio_segment(self, samples: np.ndarray) -> Optional[str]:
         """Transcribe audio segment to text."""
+        if len(samples) == 0:
+            return None
+        
+        pcm = samples.tobytes()
+        
+        # Identical audio always transcribes the same, skip the round trip
+        cache_key = hashlib.sha256(pcm).digest()
+        with self._cache_lock:
+            if cache_key in self._transcription_cache:
+                self._transcription_cache.move_to_end(cache_key)
+                return self._transcription_cache[cache_key]
+        
         try:
-            # Create a temporary WAV file for speech recognition
-            with tempfile.NamedTemporaryFile(suffix=".wav", delete=False) as temp_file:
-                # Convert MP3 data to WAV for speech recognition
-                audio_segment = PydubAudioSegment.from_mp3(io.BytesIO(audio_data))
-                audio_segment = audio_segment.set_channels(1).set_frame_rate(SAMPLE_RATE)
-                audio_segment.export(temp_file.name, format="wav")
-                
-                # Transcribe using speech recognition
-                with sr.AudioFile(temp_file.name) as source:
-                    audio = self.recognizer.record(source)
-                    text = self.recognizer.recognize_google(
-                        audio, 
-                        language=SPEECH_RECOGNITION_LANGUAGE
-                    )
-                    
-                # Clean up temp file
-                Path(temp_file.name).unlink()
-                return text
+            # Hand the decoded PCM straight to speech recognition
+            audio_data = sr.AudioData(pcm, SAMPLE_RATE, samples.itemsize)
+            text = self.recognizer.recognize_google(
+                audio_data, 
+                language=SPEECH_RECOGNITION_LANGUAGE
+            )
                 
         except (sr.UnknownValueError, sr.RequestError, Exception):
             return None
+        
+        with self._cache_lock:
+            self._transcription_cache[cache_key] = text
+            if len(self._transcription_cache) > TRANSCRIPTION_CACHE_SIZE:
+                self._transcription_cache.popitem(last=False)
+        
+        return text
+    
+    async def _transcribe_all(self, segments: List[np.ndarray]) -> List[Optional[str]]:
+        """Transcribe segments concurrently."""
+        loop = asyncio.get_event_loop()
+        
+        # Recognition is network-bound, so issue every request at once
+        return await asyncio.gather(*[
+            loop.run_in_executor(self.io_pool, self._transcribe_audio_segment, segment_samples)
+            for segment_samples in segments
+        ])
+    
+    def _encode_mp3(self, samples: np.ndarray) -> bytes:
+        """Encode mono SAMPLE_RATE samples as MP3."""
+        # Encode in-process with libmp3lame; an encoder cannot be reused
+        # after flush() and is not thread-safe, so each segment gets its own
+        encoder = lameenc.Encoder()
+        encoder.set_bit_rate(64)
+        encoder.set_in_sample_rate(SAMPLE_RATE)
+        encoder.set_channels(1)
+        encoder.set_quality(5)
+        return bytes(encoder.encode(samples.tobytes()) + encoder.flush())
+    
+    def _index_frames(self, file_path: Path, source) -> Optional[Mp3FrameIndex]:
+        """Index the source's MP3 frames, or return None if it is not an MP3 stream."""
+        # Other formats libsndfile decodes (e.g. a renamed WAV) must be re-encoded
+        if soundfile.info(str(file_path)).format != "MP3":
+            return None
+        return Mp3FrameIndex.build(source)
     
-    def _split_by_sentences(self, audio: PydubAudioSegment, speech_ranges: List[Tuple[int, int]]) -> List[Tuple[PydubAudioSegment, str]]:
-        """Split audio into sentence-based segments using speech-to-text."""
+    async def process_audio_file(self, file_path: Path, file_hash: str) -> List[AudioSegment]:
+        """Process audio file and return list of sentence segments."""
+        loop = asyncio.get_event_loop()
+        
+        # Load audio file and split it into sentence segments in a worker process
+        sentence_segments = await self._load_and_detect(file_path)
+        texts = await self._transcribe_all([segment_audio for _, segment_audio in sentence_segments])
+        
+        # Create AudioSegment objects
         segments = []
+        timestamp = datetime.now()
         
-        for start_ms, end_ms in speech_ranges:
-            # Extract audio segment
-            segment_audio = audio[start_ms:end_ms]
+        with open(file_path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as source:
+            # Index the source frames so segments can be cut without re-encoding
+            frame_index = await loop.run_in_executor(self.io_pool, self._index_frames, file_path, source)
             
-            # Skip very short or very long segments
-            duration_seconds = len(segment_audio) / 1000.0
-            if duration_seconds < SENTENCE_MIN_LENGTH or duration_seconds > SENTENCE_MAX_LENGTH:
-                continue
-            
-            # Export segment to bytes for transcription
-            buffer = io.BytesIO()
-            segment_audio.export(buffer, format="mp3")
-            audio_data = buffer.getvalue()
+            sequence = 0
+            for ((start_ms, end_ms), segment_audio), text in zip(sentence_segments, texts):
+                if not text:
+                    continue
+                
+                # Copy the encoded frames, falling back to encoding the PCM
+                if frame_index is not None:
+                    audio_bytes = frame_index.slice(start_ms, end_ms)
+                else:
+                    audio_bytes = await loop.run_in_executor(self.io_pool, self._encode_mp3, segment_audio)
+                
+                # Calculate segment length
+                length_seconds = len(segment_audio) / SAMPLE_RATE
+                
+                segment = AudioSegment(
+                    file_hash=file_hash,
+                    timestamp=timestamp,
+                    filename_sequence=sequence,
+                    length_seconds=length_seconds,
+                    text_content=text,
+                    file_path=""  # Will be set after saving
+                )
+                
+                segments.append((segment, audio_bytes))
+                sequence += 1
+        
+        return segments
+    
+    def _decode_stream(self, state: StreamState, audio_data: bytes) -> np.ndarray:
+        """Decode the complete MP3 frames received so far on a stream."""
+        state.pending += audio_data
+        frame_index = Mp3FrameIndex.build(state.pending)
+        
+        # Bytes past the indexed frames and further back than SYNC_SPAN can
+        # no longer start a frame, so drop them rather than let non-MP3 input
+        # pile up and be rescanned on every chunk
+        frames_end = frame_index.offsets[-1] if frame_index else 0
+        junk_end = len(state.pending) - SYNC_SPAN
+        if junk_end > frames_end:
+            del state.pending[frames_end:junk_end]
+        
+        # The decoder needs at least two frames, and new ones past the primer
+        n_frames = len(frame_index.offsets) - 1 if frame_index else 0
+        if n_frames < 2 or n_frames <= state.primer_frames:
+            return np.zeros(0, dtype=np.int16)
+        
+        frames = bytes(state.pending[frame_index.offsets[0]:frame_index.offsets[-1]])
+        samples, sample_rate = soundfile.read(io.BytesIO(frames), dtype="int16", always_2d=True)
+        
+        # Drop the primer output, it was already produced by the last batch
+        primer_ms = frame_index.times_ms[state.primer_frames] - frame_index.times_ms[0]
+        samples = samples[round(primer_ms * sample_rate / 1000):]
+        
+        # Keep the last frames in front of the next batch as its primer
+        keep = max(n_frames - STREAM_PRIMER_FRAMES, 0)
+        del state.pending[:frame_index.offsets[keep]]
+        state.primer_frames = n_frames - keep
+        
+        return to_mono_int16(samples, sample_rate)
+    
+    def _take_stream_segments(self, state: StreamState, final: bool = False) -> List[np.ndarray]:
+        """Cut finished speech out of the stream buffer.
+        
+        A speech range is finished once silence follows it; with final set,
+        any speech still in progress is cut as well.
+        """
+        samples_per_ms = SAMPLE_RATE // 1000
+        buffered = state.buffer[:state.length]
+        mean_square = state.energy / state.sample_count if state.sample_count else 0.0
+        ranges = self._detect_speech_segments(buffered, mean_square)
+        
+        if final:
+            finished, keep_from = ranges, state.length
+        elif ranges and ranges[-1][1] >= state.length // samples_per_ms:
+            # The last range runs to the end of the buffer, still in progress
+            finished, keep_from = ranges[:-1], ranges[-1][0] * samples_per_ms
+        else:
+            # Keep a silence window of context for the next speech onset
+            finished = ranges
+            keep_from = max(
+                state.length - SILENCE_THRESHOLD * samples_per_ms,
+                finished[-1][1] * samples_per_ms if finished else 0
+            )
+        
+        segments = [
+            buffered[start_ms * samples_per_ms:end_ms * samples_per_ms].copy()
+            for start_ms, end_ms in finished
+        ]
+        
+        remaining = state.length - keep_from
+        state.buffer[:remaining] = state.buffer[keep_from:state.length]
+        state.length = remaining
+        return segments
+    
+    def _feed_stream(self, state: StreamState, audio_data: bytes) -> List[np.ndarray]:
+        """Feed a chunk of a stream and return the speech it completes."""
+        samples = self._decode_stream(state, audio_data)
+        state.energy += float(np.dot(samples, samples.astype(np.float64)))
+        state.sample_count += len(samples)
+        
+        segments = []
+        offset = 0
+        while offset < len(samples):
+            if state.length == len(state.buffer):
+                # Speech has run for the whole buffer, cut it here
+                segments += self._take_stream_segments(state, final=True)
             
-            # Transcribe segment
-            text = self._transcribe_audio_segment(audio_data)
+            count = min(len(samples) - offset, len(state.buffer) - state.length)
+            state.buffer[state.length:state.length + count] = samples[offset:offset + count]
+            state.length += count
+            offset += count
             
-            # If transcription successful and contains sentence-ending punctuation
-            if text and any(punct in text for punct in ['.', '!', '?']):
-                segments.append((segment_audio, text))
-            elif text:  # Include segments with text even without punctuation
-                segments.append((segment_audio, text))
+            segments += self._take_stream_segments(state)
         
         return segments
     
-    async def process_audio_file(self, file_path: Path, file_hash: str) -> List[AudioSegment]:
-        """Process audio file and return list of sentence segments."""
+    async def _build_stream_segments(self, segment_samples: List[np.ndarray], file_hash: str, sequence_offset: int) -> List[AudioSegment]:
+        """Transcribe and encode speech cut from a stream."""
         loop = asyncio.get_event_loop()
         
-        # Load audio file
-        audio = await loop.run_in_executor(self.executor, self._load_audio, file_path)
+        # Skip very short or very long segments
+        segment_samples = [samples for samples in segment_samples if is_sentence_length(samples)]
+        texts = await self._transcribe_all(segment_samples)
         
-        # Detect speech segments
-        speech_ranges = await loop.run_in_executor(
-            self.executor, 
-            self._detect_speech_segments, 
-            audio
-        )
-        
-        # Split into sentence segments
-        sentence_segments = await loop.run_in_executor(
-            self.executor,
-            self._split_by_sentences,
-            audio,
-            speech_ranges
-        )
-        
-        # Create AudioSegment objects
         segments = []
         timestamp = datetime.now()
+        sequence = sequence_offset
         
-        for sequence, (segment_audio, text) in enumerate(sentence_segments):
-            # Export segment to bytes
-            buffer = io.BytesIO()
-            segment_audio.export(buffer, format="mp3")
+        for segment_audio, text in zip(segment_samples, texts):
+            if not text:
+                continue
             
-            # Calculate segment length
-            length_seconds = len(segment_audio) / 1000.0
+            audio_bytes = await loop.run_in_executor(self.io_pool, self._encode_mp3, segment_audio)
             
             segment = AudioSegment(
                 file_hash=file_hash,
                 timestamp=timestamp,
                 filename_sequence=sequence,
-                length_seconds=length_seconds,
+                length_seconds=len(segment_audio) / SAMPLE_RATE,
                 text_content=text,
                 file_path=""  # Will be set after saving
             )
             
-            segments.append((segment, buffer.getvalue()))
+            segments.append((segment, audio_bytes))
+            sequence += 1
         
         return segments
     
-    async def process_audio_stream(self, audio_data: bytes, file_hash: str, sequence_offset: int = 0) -> List[AudioSegment]:
-        """Process streaming audio data."""
-        # Save to temporary file
-        with tempfile.NamedTemporaryFile(suffix=".mp3", delete=False) as temp_file:
-            temp_file.write(audio_data)
-            temp_path = Path(temp_file.name)
-        
-        try:
-            # Process the temporary file
-            segments = await self.process_audio_file(temp_path, file_hash)
-            
-            # Adjust sequence numbers
-            for i, (segment, _) in enumerate(segments):
-                segment.filename_sequence += sequence_offset
-            
-            return segments
-        finally:
-            # Clean up temporary file
-            temp_path.unlink()
+    async def process_audio_stream(self, state: StreamState, audio_data: bytes, file_hash: str, sequence_offset: int = 0) -> List[AudioSegment]:
+        """Process streaming audio data, returning the segments it completes."""
+        loop = asyncio.get_event_loop()
+        segment_samples = await loop.run_in_executor(self.io_pool, self._feed_stream, state, audio_data)
+        return await self._build_stream_segments(segment_samples, file_hash, sequence_offset)
+    
+    async def finish_audio_stream(self, state: StreamState, file_hash: str, sequence_offset: int = 0) -> List[AudioSegment]:
+        """Process speech still buffered when a stream ends."""
+        loop = asyncio.get_event_loop()
+        segment_samples = await loop.run_in_executor(self.io_pool, self._take_stream_segments, state, True)
+        return await self._build_stream_segments(segment_samples, file_hash, sequence_offset)
 
 # Global audio processor instance
 audio_processor = AudioProcessor()
@@ -0,0 +1,47 @@
+import threading
+from contextlib import contextmanager
+from typing import Iterator, List
+
+class BufferPool:
+    """Reusable bytearrays in power-of-two size classes."""
+    
+    def __init__(self, max_size: int = 8 * 1024 * 1024, max_free: int = 8):
+        self._max_class = (max_size - 1).bit_length()
+        self._max_free = max_free
+        self._pools: List[List[bytearray]] = [[] for _ in range(self._max_class + 1)]
+        self._lock = threading.Lock()
+    
+    def get(self, size: int) -> bytearray:
+        """Get a buffer of at least size bytes."""
+        size_class = max(size - 1, 0).bit_length()
+        if size_class > self._max_class:
+            return bytearray(size)
+        
+        with self._lock:
+            free = self._pools[size_class]
+            if free:
+                return free.pop()
+        return bytearray(1 << size_class)
+    
+    def put(self, buf: bytearray):
+        """Return a buffer obtained from get() to its size class."""
+        size_class = len(buf).bit_length() - 1
+        if not buf or size_class > self._max_class or len(buf) != 1 << size_class:
+            return
+        
+        with self._lock:
+            free = self._pools[size_class]
+            if len(free) < self._max_free:
+                free.append(buf)
+    
+    @contextmanager
+    def buffer(self, size: int) -> Iterator[bytearray]:
+        """Borrow a buffer of at least size bytes for the duration of a block."""
+        buf = self.get(size)
+        try:
+            yield buf
+        finally:
+            self.put(buf)
+
+# Global buffer pool instance
+buffer_pool = BufferPool()
@@ -8,16 +8,25 @@ DATABASE_URL = "sqlite:///./audio_segments.db"
 SEGMENTS_DIR = Path("./segments")
 MAX_FILE_SIZE = 100 * 1024 * 1024  # 100MB
 SUPPORTED_FORMATS = [".mp3"]
+SEGMENT_DIR_CACHE_SIZE = 1024  # file hashes whose segment directory is known to exist
+HASH_READS_IN_FLIGHT = 8  # concurrent CHUNK_SIZE reads when hashing with caio
+HASH_MULTITHREAD_MIN_SIZE = 64 * 1024 * 1024  # 64MB, hash larger files on all cores
 
 # Audio processing configuration
 CHUNK_SIZE = 1024 * 1024  # 1MB chunks for streaming
 SAMPLE_RATE = 16000
 SILENCE_THRESHOLD = 500  # ms
+STREAM_BUFFER_SECONDS = 60  # undecided stream audio kept in memory
+STREAM_PRIMER_FRAMES = 3  # MP3 frames re-decoded to warm up the decoder
+AUDIO_PROCESS_WORKERS = os.cpu_count()  # processes for decoding and silence detection
+DECODE_BLOCK_FRAMES = 1024 * 1024  # frames decoded and resampled at a time
 
 # Speech recognition configuration
 SPEECH_RECOGNITION_LANGUAGE = "en-US"
 SENTENCE_MIN_LENGTH = 1.0  # seconds
 SENTENCE_MAX_LENGTH = 30.0  # seconds
+TRANSCRIPTION_WORKERS = 16  # concurrent recognition requests
+TRANSCRIPTION_CACHE_SIZE = 4096  # cached segment transcriptions
 
 # Create directories
 SEGMENTS_DIR.mkdir(exist_ok=True)
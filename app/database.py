@@ -1,4 +1,5 @@
 import sqlite3
+import asyncio
 import aiosqlite
 from datetime import datetime
 from typing import List, Optional
@@ -8,10 +9,34 @@ from .config import DATABASE_URL
 class DatabaseManager:
     def __init__(self, db_path: str = "audio_segments.db"):
         self.db_path = db_path
+        self._conn: Optional[aiosqlite.Connection] = None
+        # Serializes statement + commit pairs on the shared connection
+        self._lock = asyncio.Lock()
+    
+    async def _connect(self) -> aiosqlite.Connection:
+        """Return the shared connection, opening it on first use."""
+        if self._conn is None:
+            self._conn = await aiosqlite.connect(self.db_path)
+            self._conn.row_factory = aiosqlite.Row
+            await self._conn.execute("PRAGMA journal_mode=WAL")
+            await self._conn.execute("PRAGMA synchronous=NORMAL")
+            await self._conn.execute("PRAGMA temp_store=MEMORY")
+        return self._conn
+    
+    async def close(self):
+        """Close the shared connection."""
+        async with self._lock:
+            if self._conn is not None:
+                await self._conn.close()
+                self._conn = None
         
     async def init_db(self):
         """Initialize the database with required tables."""
-        async with aiosqlite.connect(self.db_path) as db:
+        # Reopen in case db_path changed since the last connection
+        await self.close()
+        
+        async with self._lock:
+            db = await self._connect()
             await db.execute("""
                 CREATE TABLE IF NOT EXISTS audio_segments (
                     id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -25,9 +50,32 @@ class DatabaseManager:
                 )
             """)
             
+            # Databases from before the unique index may hold duplicate
+            # (hash, sequence) rows; keep the newest of each
+            cursor = await db.execute("""
+                SELECT 1 FROM sqlite_master 
+                WHERE type = 'index' AND name = 'idx_hash_seq_unique'
+            """)
+            if await cursor.fetchone() is None:
+                await db.execute("""
+                    DELETE FROM audio_segments WHERE id NOT IN (
+                        SELECT MAX(id) FROM audio_segments 
+                        GROUP BY file_hash, filename_sequence
+                    )
+                """)
+            
             await db.execute("""
-                CREATE INDEX IF NOT EXISTS idx_file_hash 
-                ON audio_segments(file_hash)
+                DROP INDEX IF EXISTS idx_hash_seq
+            """)
+            
+            # Serves lookups by hash alone as well as by (hash, sequence)
+            await db.execute("""
+                CREATE UNIQUE INDEX IF NOT EXISTS idx_hash_seq_unique 
+                ON audio_segments(file_hash, filename_sequence)
+            """)
+            
+            await db.execute("""
+                DROP INDEX IF EXISTS idx_file_hash
             """)
             
             await db.execute("""
@@ -39,11 +87,18 @@ class DatabaseManager:
     
     async def insert_segment(self, segment: AudioSegment) -> int:
         """Insert a new audio segment and return its ID."""
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self._lock:
+            db = await self._connect()
             cursor = await db.execute("""
                 INSERT INTO audio_segments 
                 (file_hash, timestamp, filename_sequence, length_seconds, text_content, file_path)
                 VALUES (?, ?, ?, ?, ?, ?)
+                ON CONFLICT(file_hash, filename_sequence) DO UPDATE SET
+                    timestamp = excluded.timestamp,
+                    length_seconds = excluded.length_seconds,
+                    text_content = excluded.text_content,
+                    file_path = excluded.file_path
+                RETURNING id
             """, (
                 segment.file_hash,
                 segment.timestamp,
@@ -52,13 +107,53 @@ class DatabaseManager:
                 segment.text_content,
                 segment.file_path
             ))
+            # lastrowid is not updated when the upsert hits an existing row
+            row = await cursor.fetchone()
             await db.commit()
-            return cursor.lastrowid
+            return row["id"]
+    
+    async def insert_segments_many(self, segments: List[AudioSegment]):
+        """Insert audio segments in a single transaction, replacing any with the same sequence."""
+        async with self._lock:
+            db = await self._connect()
+            await db.executemany("""
+                INSERT INTO audio_segments 
+                (file_hash, timestamp, filename_sequence, length_seconds, text_content, file_path)
+                VALUES (?, ?, ?, ?, ?, ?)
+                ON CONFLICT(file_hash, filename_sequence) DO UPDATE SET
+                    timestamp = excluded.timestamp,
+                    length_seconds = excluded.length_seconds,
+                    text_content = excluded.text_content,
+                    file_path = excluded.file_path
+            """, [
+                (
+                    segment.file_hash,
+                    segment.timestamp,
+                    segment.filename_sequence,
+                    segment.length_seconds,
+                    segment.text_content,
+                    segment.file_path
+                )
+                for segment in segments
+            ])
+            await db.commit()
+    
+    def _row_to_segment(self, row: aiosqlite.Row) -> AudioSegment:
+        """Build an AudioSegment from an audio_segments row."""
+        return AudioSegment(
+            id=row["id"],
+            file_hash=row["file_hash"],
+            timestamp=datetime.fromisoformat(row["timestamp"]),
+            filename_sequence=row["filename_sequence"],
+            length_seconds=row["length_seconds"],
+            text_content=row["text_content"],
+            file_path=row["file_path"]
+        )
     
     async def get_segments_by_hash(self, file_hash: str) -> List[AudioSegment]:
         """Get all segments for a specific file hash."""
-        async with aiosqlite.connect(self.db_path) as db:
-            db.row_factory = aiosqlite.Row
+        async with self._lock:
+            db = await self._connect()
             cursor = await db.execute("""
                 SELECT * FROM audio_segments 
                 WHERE file_hash = ? 
@@ -66,43 +161,39 @@ class DatabaseManager:
             """, (file_hash,))
             
             rows = await cursor.fetchall()
-            return [
-                AudioSegment(
-                    id=row["id"],
-                    file_hash=row["file_hash"],
-                    timestamp=datetime.fromisoformat(row["timestamp"]),
-                    filename_sequence=row["filename_sequence"],
-                    length_seconds=row["length_seconds"],
-                    text_content=row["text_content"],
-                    file_path=row["file_path"]
-                )
-                for row in rows
-            ]
+            return [self._row_to_segment(row) for row in rows]
+    
+    async def get_segment_by_hash_and_sequence(self, file_hash: str, sequence: int) -> Optional[AudioSegment]:
+        """Get a specific segment by file hash and sequence number."""
+        async with self._lock:
+            db = await self._connect()
+            cursor = await db.execute("""
+                SELECT * FROM audio_segments 
+                WHERE file_hash = ? AND filename_sequence = ?
+            """, (file_hash, sequence))
+            
+            row = await cursor.fetchone()
+            if row:
+                return self._row_to_segment(row)
+            return None
     
     async def get_segment_by_id(self, segment_id: int) -> Optional[AudioSegment]:
         """Get a specific segment by ID."""
-        async with aiosqlite.connect(self.db_path) as db:
-            db.row_factory = aiosqlite.Row
+        async with self._lock:
+            db = await self._connect()
             cursor = await db.execute("""
                 SELECT * FROM audio_segments WHERE id = ?
             """, (segment_id,))
             
             row = await cursor.fetchone()
             if row:
-                return AudioSegment(
-                    id=row["id"],
-                    file_hash=row["file_hash"],
-                    timestamp=datetime.fromisoformat(row["timestamp"]),
-                    filename_sequence=row["filename_sequence"],
-                    length_seconds=row["length_seconds"],
-                    text_content=row["text_content"],
-                    file_path=row["file_path"]
-                )
+                return self._row_to_segment(row)
             return None
     
     async def delete_segments_by_hash(self, file_hash: str) -> int:
         """Delete all segments for a specific file hash."""
-        async with aiosqlite.connect(self.db_path) as db:
+        async with self._lock:
+            db = await self._connect()
             cursor = await db.execute("""
                 DELETE FROM audio_segments WHERE file_hash = ?
             """, (file_hash,))
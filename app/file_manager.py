@@ -1,72 +1,318 @@
-import hashlib
-import aiofiles
+import asyncio
+import concurrent.futures
+import hmac
+import mmap
+import os
+import secrets
+import stat
+import threading
+from collections import deque
+from blake3 import blake3
 from pathlib import Path
-from typing import BinaryIO
-from .config import SEGMENTS_DIR
+from typing import BinaryIO, Dict, List, Optional, Tuple
+from .buffer_pool import buffer_pool
+from .config import (
+    SEGMENTS_DIR,
+    CHUNK_SIZE,
+    HASH_READS_IN_FLIGHT,
+    HASH_MULTITHREAD_MIN_SIZE,
+    SEGMENT_DIR_CACHE_SIZE
+)
+
+try:
+    import caio
+except ImportError:  # fall back to hashing in a worker thread
+    caio = None
+
+# Shared by every verify_many call
+_verify_executor = concurrent.futures.ThreadPoolExecutor(max_workers=os.cpu_count())
 
 class FileManager:
+    __slots__ = ("base_dir", "_base_str", "_temp_str", "_dir_cache", "_dir_cache_lock")
+    
     def __init__(self, base_dir: Path = SEGMENTS_DIR):
         self.base_dir = base_dir
         self.base_dir.mkdir(exist_ok=True)
+        # String forms of the fixed directories for the os-level hot paths
+        self._base_str = str(base_dir)
+        self._temp_str = os.path.join(self._base_str, "temp")
+        # Hashes whose segment directory is known to exist, oldest first
+        self._dir_cache: Dict[str, None] = {}
+        self._dir_cache_lock = threading.Lock()
+    
+    def create_hasher(self):
+        """Create an incremental BLAKE3 hash object for streamed data."""
+        return blake3()
+    
+    def _digest(self, data: bytes) -> bytes:
+        """Calculate raw BLAKE3 digest of data."""
+        return blake3(data).digest()
     
     def calculate_hash(self, data: bytes) -> str:
-        """Calculate SHA-256 hash of file data."""
-        return hashlib.sha256(data).hexdigest()
+        """Calculate BLAKE3 hash of file data."""
+        return self._digest(data).hex()
+    
+    def _digest_stream(self, f: BinaryIO) -> bytes:
+        """Calculate raw BLAKE3 digest of an open file in CHUNK_SIZE reads."""
+        hash_obj = blake3()
+        
+        # Large reads into one reused buffer keep the hash loop in C
+        with buffer_pool.buffer(CHUNK_SIZE) as buffer:
+            view = memoryview(buffer)[:CHUNK_SIZE]
+            while read_size := f.readinto(view):
+                hash_obj.update(view[:read_size])
+        
+        return hash_obj.digest()
+    
+    def _digest_file(self, file_path: Path, size: Optional[int] = None, multithreaded: bool = True) -> bytes:
+        """Calculate raw BLAKE3 digest of a file, memory-mapping large ones.
+        
+        size may be passed by callers that have already stat()ed the file;
+        callers already running in a pool clear multithreaded.
+        """
+        with open(file_path, 'rb') as f:
+            if size is None:
+                size = os.fstat(f.fileno()).st_size
+            
+            # Files under one chunk are read in a single call, cheaper than mapping
+            if size < CHUNK_SIZE:
+                return self._digest_stream(f)
+            
+            try:
+                mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except (ValueError, OSError):
+                # Pipes and other special files cannot be mapped
+                return self._digest_stream(f)
+            
+            with mm:
+                # Let the kernel read ahead aggressively for the single pass
+                if hasattr(mmap, "MADV_SEQUENTIAL"):
+                    mm.madvise(mmap.MADV_SEQUENTIAL)
+                
+                # BLAKE3's tree mode splits very large files across all cores
+                if multithreaded and size > HASH_MULTITHREAD_MIN_SIZE:
+                    return blake3(mm, max_threads=blake3.AUTO).digest()
+                return blake3(mm).digest()
+    
+    async def _digest_file_aio(self, fd: int, size: int) -> bytes:
+        """Calculate raw BLAKE3 digest of a regular file with overlapping kernel AIO reads."""
+        hash_obj = blake3()
+        in_flight = deque()
+        offset = 0
+        
+        async with caio.AsyncioContext(max_requests=HASH_READS_IN_FLIGHT) as context:
+            try:
+                while offset < size or in_flight:
+                    # Keep reads queued while earlier ones are hashed, in order
+                    while offset < size and len(in_flight) < HASH_READS_IN_FLIGHT:
+                        read_size = min(CHUNK_SIZE, size - offset)
+                        read = asyncio.ensure_future(context.read(read_size, fd, offset))
+                        in_flight.append((read, read_size))
+                        offset += read_size
+                    
+                    read, read_size = in_flight.popleft()
+                    data = await read
+                    if len(data) != read_size:
+                        raise OSError("Short read while hashing file")
+                    
+                    # Hash off the event loop; queued reads keep going meanwhile
+                    await asyncio.to_thread(hash_obj.update, data)
+            finally:
+                for read, _ in in_flight:
+                    read.cancel()
+        
+        return hash_obj.digest()
     
     async def calculate_hash_from_file(self, file_path: Path) -> str:
-        """Calculate SHA-256 hash from file."""
-        hash_obj = hashlib.sha256()
-        async with aiofiles.open(file_path, 'rb') as f:
-            while chunk := await f.read(8192):
-                hash_obj.update(chunk)
-        return hash_obj.hexdigest()
+        """Calculate BLAKE3 hash from file."""
+        if caio is not None:
+            fd = os.open(file_path, os.O_RDONLY)
+            try:
+                file_stat = os.fstat(fd)
+                # Very large files hash faster on all cores than from one reader
+                if stat.S_ISREG(file_stat.st_mode) and file_stat.st_size <= HASH_MULTITHREAD_MIN_SIZE:
+                    return (await self._digest_file_aio(fd, file_stat.st_size)).hex()
+            except (OSError, SystemError):
+                # AIO unavailable here (e.g. io_setup denied), use a thread
+                pass
+            finally:
+                os.close(fd)
+        
+        return (await asyncio.to_thread(self._digest_file, file_path)).hex()
     
     def get_segment_dir(self, file_hash: str) -> Path:
         """Get directory path for storing segments of a file."""
-        segment_dir = self.base_dir / file_hash[:2] / file_hash[2:4] / file_hash
-        segment_dir.mkdir(parents=True, exist_ok=True)
+        return Path(self._segment_dir_str(file_hash))
+    
+    def _segment_dir_str(self, file_hash: str) -> str:
+        """Create the segment directory of a file and return it as a string."""
+        # One join over plain strings instead of a chain of Path divisions
+        segment_dir = os.path.join(self._base_str, file_hash[:2], file_hash[2:4], file_hash)
+        if file_hash in self._dir_cache:
+            return segment_dir
+        
+        os.makedirs(segment_dir, exist_ok=True)
+        
+        # Remember created directories, evicting the oldest past the limit;
+        # segments are saved from several worker threads at once
+        with self._dir_cache_lock:
+            self._dir_cache[file_hash] = None
+            if len(self._dir_cache) > SEGMENT_DIR_CACHE_SIZE:
+                del self._dir_cache[next(iter(self._dir_cache))]
         return segment_dir
     
+    def _save_segment_sync(self, file_hash: str, sequence: int, data: bytes) -> Path:
+        """Save audio segment to file, blocking the calling thread."""
+        segment_dir = self._segment_dir_str(file_hash)
+        filename = f"segment_{sequence:04d}.mp3"
+        file_path = os.path.join(segment_dir, filename)
+        
+        try:
+            self._write_file(file_path, data)
+        except FileNotFoundError:
+            # The cached directory was removed underneath us; recreate it once
+            with self._dir_cache_lock:
+                self._dir_cache.pop(file_hash, None)
+            self._segment_dir_str(file_hash)
+            self._write_file(file_path, data)
+        return Path(file_path)
+    
     async def save_segment(self, file_hash: str, sequence: int, data: bytes) -> Path:
         """Save audio segment to file."""
-        segment_dir = self.get_segment_dir(file_hash)
-        filename = f"segment_{sequence:04d}.mp3"
-        file_path = segment_dir / filename
+        return await asyncio.to_thread(self._save_segment_sync, file_hash, sequence, data)
+    
+    def _write_file(self, file_path: Path, data: bytes, drop_cache: bool = False, exclusive: bool = False):
+        """Write data to a file with raw os calls, bypassing Python's buffered I/O.
         
-        async with aiofiles.open(file_path, 'wb') as f:
-            await f.write(data)
+        With exclusive set the file must not exist yet, as for random temp names.
+        """
+        flags = os.O_WRONLY | os.O_CREAT | (os.O_EXCL if exclusive else os.O_TRUNC)
+        fd = os.open(file_path, flags, 0o644)
+        try:
+            view = memoryview(data)
+            while view:
+                view = view[os.write(fd, view):]
+            
+            # Start writeback and let the kernel drop the cached pages
+            if drop_cache and hasattr(os, "posix_fadvise"):
+                os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+        finally:
+            os.close(fd)
+    
+    def get_temp_dir(self) -> Path:
+        """Get directory path for temporary processing files."""
+        os.makedirs(self._temp_str, exist_ok=True)
+        return Path(self._temp_str)
+    
+    def _new_temp_path(self, suffix: str) -> Path:
+        """Return a fresh random path in the temp directory."""
+        # Temp files are not content-addressed, so skip hashing for the name
+        os.makedirs(self._temp_str, exist_ok=True)
+        return Path(os.path.join(self._temp_str, f"{secrets.token_hex(8)}{suffix}"))
+    
+    def _save_temp_file_sync(self, data: bytes, suffix: str = ".mp3") -> Path:
+        """Save temporary file for processing, blocking the calling thread."""
+        temp_path = self._new_temp_path(suffix)
         
-        return file_path
+        # Temp files are read back at most once, keep them out of the page cache
+        self._write_file(temp_path, data, drop_cache=True, exclusive=True)
+        return temp_path
     
     async def save_temp_file(self, data: bytes, suffix: str = ".mp3") -> Path:
         """Save temporary file for processing."""
-        temp_dir = self.base_dir / "temp"
-        temp_dir.mkdir(exist_ok=True)
+        return await asyncio.to_thread(self._save_temp_file_sync, data, suffix)
+    
+    def _copy_fd(self, src_fd: int, dst_fd: int, size: int):
+        """Copy size bytes from the current offset of src_fd, in the kernel where possible."""
+        remaining = size
+        if hasattr(os, "copy_file_range"):
+            try:
+                while remaining > 0:
+                    copied = os.copy_file_range(src_fd, dst_fd, remaining)
+                    if copied == 0:
+                        break
+                    remaining -= copied
+            except OSError:
+                # Unsupported for these files (e.g. a pipe or an old kernel),
+                # finish through userspace from where the kernel copy stopped
+                pass
         
-        file_hash = self.calculate_hash(data)
-        temp_path = temp_dir / f"{file_hash}{suffix}"
+        with buffer_pool.buffer(CHUNK_SIZE) as buffer:
+            view = memoryview(buffer)[:CHUNK_SIZE]
+            while remaining > 0:
+                read_size = os.readv(src_fd, [view[:min(remaining, CHUNK_SIZE)]])
+                if read_size == 0:
+                    break
+                chunk = view[:read_size]
+                while chunk:
+                    chunk = chunk[os.write(dst_fd, chunk):]
+                remaining -= read_size
+    
+    def _save_temp_file_from_fd_sync(self, src_fd: int, size: int, suffix: str = ".mp3") -> Path:
+        """Copy size bytes from src_fd into a new temporary file, blocking the calling thread."""
+        temp_path = self._new_temp_path(suffix)
         
-        async with aiofiles.open(temp_path, 'wb') as f:
-            await f.write(data)
+        fd = os.open(temp_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o644)
+        try:
+            self._copy_fd(src_fd, fd, size)
+            if hasattr(os, "posix_fadvise"):
+                os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+        except BaseException:
+            # Do not leave a partial copy behind (e.g. on ENOSPC or EIO)
+            os.close(fd)
+            os.unlink(temp_path)
+            raise
+        os.close(fd)
         
         return temp_path
     
+    async def save_temp_file_from_fd(self, src_fd: int, size: int, suffix: str = ".mp3") -> Path:
+        """Save temporary file for processing from an open file descriptor."""
+        return await asyncio.to_thread(self._save_temp_file_from_fd_sync, src_fd, size, suffix)
+    
     def verify_file_integrity(self, file_path: Path, expected_hash: str) -> bool:
         """Verify file integrity using hash comparison."""
+        return self._verify_file(file_path, expected_hash, True)
+    
+    def _verify_file(self, file_path: Path, expected_hash: str, multithreaded: bool) -> bool:
+        """Verify one file, optionally hashing it on all cores."""
         try:
-            with open(file_path, 'rb') as f:
-                actual_hash = hashlib.sha256(f.read()).hexdigest()
-            return actual_hash == expected_hash
+            # Unreadable paths and malformed hex count as a mismatch; digests
+            # are compared raw, in constant time
+            file_stat = os.stat(file_path)
+            digest = self._digest_file(file_path, file_stat.st_size, multithreaded)
+            return hmac.compare_digest(digest, bytes.fromhex(expected_hash))
         except Exception:
             return False
     
+    def verify_many(self, files_and_hashes: List[Tuple[Path, str]]) -> List[bool]:
+        """Verify the integrity of many files in parallel."""
+        # BLAKE3 hashes with the GIL released, so threads hash files
+        # concurrently; each hashes single-threaded to not oversubscribe cores
+        return list(_verify_executor.map(
+            lambda item: self._verify_file(*item, False),
+            files_and_hashes
+        ))
+    
+    def _cleanup_temp_files_sync(self):
+        """Clean up temporary files, blocking the calling thread."""
+        try:
+            entries = os.scandir(self._temp_str)
+        except FileNotFoundError:
+            return
+        
+        # Directory entries carry their type, so no per-file stat or Path objects
+        with entries:
+            for entry in entries:
+                if entry.is_file(follow_symlinks=False):
+                    try:
+                        os.unlink(entry.path)
+                    except FileNotFoundError:
+                        pass
+    
     async def cleanup_temp_files(self):
         """Clean up temporary files."""
-        temp_dir = self.base_dir / "temp"
-        if temp_dir.exists():
-            for file_path in temp_dir.iterdir():
-                if file_path.is_file():
-                    file_path.unlink()
+        await asyncio.to_thread(self._cleanup_temp_files_sync)
 
 # Global file manager instance
 file_manager = FileManager()
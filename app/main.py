@@ -1,21 +1,32 @@
-from fastapi import FastAPI, WebSocket, UploadFile, File, HTTPException, WebSocketDisconnect
-from fastapi.responses import FileResponse
+from fastapi import FastAPI, WebSocket, UploadFile, File, HTTPException, WebSocketDisconnect, Request
+from fastapi.responses import FileResponse, ORJSONResponse, Response
+from fastapi.concurrency import run_in_threadpool
+import aiofiles.tempfile
 import asyncio
+import os
+import secrets
+import stat
 import time
+from pathlib import Path, PurePosixPath
 from datetime import datetime
-from typing import List
-import json
+from typing import List, Tuple
+import orjson
 
 from .models import UploadResponse, SegmentInfo, StreamStatus, AudioSegment
 from .database import db_manager
 from .file_manager import file_manager
-from .audio_processor import audio_processor
-from .config import MAX_FILE_SIZE, SUPPORTED_FORMATS
+from .audio_processor import audio_processor, StreamState
+from .buffer_pool import buffer_pool
+from .config import MAX_FILE_SIZE, SUPPORTED_FORMATS, CHUNK_SIZE
+
+# Lowercased once for the per-upload extension check
+_SUPPORTED = frozenset(fmt.lower() for fmt in SUPPORTED_FORMATS)
 
 app = FastAPI(
     title="Audio Segmentation API",
     description="Real-time audio streaming API with sentence-based segmentation",
-    version="1.0.0"
+    version="1.0.0",
+    default_response_class=ORJSONResponse
 )
 
 @app.on_event("startup")
@@ -23,59 +34,78 @@ async def startup_event():
     """Initialize database on startup."""
     await db_manager.init_db()
 
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Close database connection on shutdown."""
+    await db_manager.close()
+
 @app.get("/health")
 async def health_check():
     """Health check endpoint."""
     return {"status": "healthy", "timestamp": datetime.now()}
 
+async def _store_segments(file_hash: str, segments_data: List[Tuple[AudioSegment, bytes]]):
+    """Write segment files concurrently, then record them in one transaction."""
+    segment_paths = await asyncio.gather(*[
+        file_manager.save_segment(file_hash, segment.filename_sequence, audio_data)
+        for segment, audio_data in segments_data
+    ])
+    
+    # Update segments with file paths
+    for (segment, _), segment_path in zip(segments_data, segment_paths):
+        segment.file_path = str(segment_path)
+    
+    await db_manager.insert_segments_many([segment for segment, _ in segments_data])
+
 @app.post("/upload", response_model=UploadResponse)
 async def upload_audio_file(file: UploadFile = File(...)):
     """Upload and process audio file."""
     start_time = time.time()
     
     # Validate file format
-    if not any(file.filename.lower().endswith(fmt) for fmt in SUPPORTED_FORMATS):
+    if PurePosixPath(file.filename or "").suffix.lower() not in _SUPPORTED:
         raise HTTPException(
             status_code=400, 
             detail=f"Unsupported file format. Supported: {SUPPORTED_FORMATS}"
         )
     
-    # Read file data
-    file_data = await file.read()
-    
-    # Validate file size
-    if len(file_data) > MAX_FILE_SIZE:
-        raise HTTPException(
-            status_code=413,
-            detail=f"File too large. Maximum size: {MAX_FILE_SIZE} bytes"
-        )
-    
-    # Calculate file hash
-    file_hash = file_manager.calculate_hash(file_data)
-    
-    # Save temporary file for processing
-    temp_path = await file_manager.save_temp_file(file_data)
-    
+    temp_path = None
     try:
+        # Stream the upload to disk, hashing and size-checking in the same pass
+        hash_obj = file_manager.create_hasher()
+        total_size = 0
+        async with aiofiles.tempfile.NamedTemporaryFile(
+            suffix=".mp3",
+            dir=file_manager.get_temp_dir(),
+            delete=False
+        ) as temp_file:
+            temp_path = Path(temp_file.name)
+            
+            # Read into one pooled buffer instead of allocating per chunk
+            with buffer_pool.buffer(CHUNK_SIZE) as buffer:
+                view = memoryview(buffer)[:CHUNK_SIZE]
+                while read_size := await run_in_threadpool(file.file.readinto, view):
+                    total_size += read_size
+                    
+                    # Validate file size
+                    if total_size > MAX_FILE_SIZE:
+                        raise HTTPException(
+                            status_code=413,
+                            detail=f"File too large. Maximum size: {MAX_FILE_SIZE} bytes"
+                        )
+                    
+                    chunk = view[:read_size]
+                    hash_obj.update(chunk)
+                    await temp_file.write(chunk)
+        
+        file_hash = hash_obj.hexdigest()
+        
         # Process audio file
         segments_data = await audio_processor.process_audio_file(temp_path, file_hash)
         
-        # Save segments and store in database
-        segments_count = 0
-        for segment, audio_data in segments_data:
-            # Save segment file
-            segment_path = await file_manager.save_segment(
-                file_hash, 
-                segment.filename_sequence, 
-                audio_data
-            )
-            
-            # Update segment with file path
-            segment.file_path = str(segment_path)
-            
-            # Store in database
-            await db_manager.insert_segment(segment)
-            segments_count += 1
+        # Save segment files concurrently and store in database
+        await _store_segments(file_hash, segments_data)
+        segments_count = len(segments_data)
         
         processing_time = time.time() - start_time
         
@@ -88,7 +118,8 @@ async def upload_audio_file(file: UploadFile = File(...)):
     
     finally:
         # Clean up temporary file
-        temp_path.unlink()
+        if temp_path:
+            temp_path.unlink(missing_ok=True)
 
 @app.get("/segments/{file_hash}", response_model=List[SegmentInfo])
 async def get_segments(file_hash: str):
@@ -110,75 +141,74 @@ async def get_segments(file_hash: str):
     ]
 
 @app.get("/segments/{file_hash}/{sequence}")
-async def download_segment(file_hash: str, sequence: int):
+async def download_segment(file_hash: str, sequence: int, request: Request):
     """Download a specific audio segment."""
-    segments = await db_manager.get_segments_by_hash(file_hash)
-    
-    # Find segment with matching sequence
-    target_segment = None
-    for segment in segments:
-        if segment.filename_sequence == sequence:
-            target_segment = segment
-            break
+    target_segment = await db_manager.get_segment_by_hash_and_sequence(file_hash, sequence)
     
     if not target_segment:
         raise HTTPException(status_code=404, detail="Segment not found")
     
-    # Verify file exists and integrity
+    # Verify file exists
     segment_path = target_segment.file_path
-    if not file_manager.verify_file_integrity(segment_path, file_hash):
-        raise HTTPException(status_code=500, detail="File integrity check failed")
+    try:
+        file_stat = os.stat(segment_path)
+    except FileNotFoundError:
+        file_stat = None
+    if file_stat is None or not stat.S_ISREG(file_stat.st_mode):
+        raise HTTPException(status_code=404, detail="Segment file not found")
+    
+    # The same URL can serve new audio after a delete and re-upload, so tie
+    # the validator to the file itself and have clients revalidate
+    etag = f'"{file_stat.st_size:x}-{file_stat.st_mtime_ns:x}"'
+    headers = {
+        "ETag": etag,
+        "Cache-Control": "public, no-cache"
+    }
+    
+    if_none_match = request.headers.get("if-none-match", "")
+    if if_none_match == "*" or etag in (tag.strip() for tag in if_none_match.split(",")):
+        return Response(status_code=304, headers=headers)
     
     return FileResponse(
         segment_path,
         media_type="audio/mpeg",
-        filename=f"segment_{sequence:04d}.mp3"
+        filename=f"segment_{sequence:04d}.mp3",
+        headers=headers,
+        stat_result=file_stat
     )
 
+def _dump_status(status: StreamStatus) -> str:
+    """Serialize a stream status update with orjson."""
+    return orjson.dumps(status.model_dump()).decode()
+
 @app.websocket("/stream")
 async def websocket_endpoint(websocket: WebSocket):
     """WebSocket endpoint for real-time audio streaming."""
     await websocket.accept()
     
-    current_hash = None
+    # A random id per session; chunk contents (e.g. a shared ID3 header)
+    # are not unique between clients
+    current_hash = secrets.token_hex(32)
     sequence_counter = 0
+    stream_state = StreamState()
     
     try:
         while True:
             # Receive audio data
             data = await websocket.receive_bytes()
             
-            # Calculate hash for this chunk
-            chunk_hash = file_manager.calculate_hash(data)
-            
-            # If this is a new stream, reset counter
-            if current_hash != chunk_hash:
-                current_hash = chunk_hash
-                sequence_counter = 0
-            
             try:
-                # Process audio chunk
+                # Process audio chunk, keeping unfinished speech buffered
                 segments_data = await audio_processor.process_audio_stream(
+                    stream_state,
                     data, 
                     current_hash, 
                     sequence_counter
                 )
                 
                 # Save segments and store in database
-                for segment, audio_data in segments_data:
-                    # Save segment file
-                    segment_path = await file_manager.save_segment(
-                        current_hash,
-                        segment.filename_sequence,
-                        audio_data
-                    )
-                    
-                    # Update segment with file path
-                    segment.file_path = str(segment_path)
-                    
-                    # Store in database
-                    await db_manager.insert_segment(segment)
-                    sequence_counter += 1
+                await _store_segments(current_hash, segments_data)
+                sequence_counter += len(segments_data)
                 
                 # Send status update
                 status = StreamStatus(
@@ -186,7 +216,7 @@ async def websocket_endpoint(websocket: WebSocket):
                     segments_processed=len(segments_data),
                     current_file_hash=current_hash
                 )
-                await websocket.send_text(status.json())
+                await websocket.send_text(_dump_status(status))
                 
             except Exception as e:
                 # Send error status
@@ -195,10 +225,22 @@ async def websocket_endpoint(websocket: WebSocket):
                     segments_processed=0,
                     current_file_hash=current_hash
                 )
-                await websocket.send_text(error_status.json())
+                await websocket.send_text(_dump_status(error_status))
     
     except WebSocketDisconnect:
         print(f"WebSocket disconnected for hash: {current_hash}")
+        
+        # Speech still buffered at the end of the stream
+        if stream_state.sample_count:
+            try:
+                segments_data = await audio_processor.finish_audio_stream(
+                    stream_state,
+                    current_hash,
+                    sequence_counter
+                )
+                await _store_segments(current_hash, segments_data)
+            except Exception as e:
+                print(f"Failed to flush stream {current_hash}: {str(e)}")
     except Exception as e:
         print(f"WebSocket error: {str(e)}")
         await websocket.close()
@@ -0,0 +1,173 @@
+import bisect
+from typing import List, Optional
+
+# Layer III bitrates in kbps, indexed by the header's bitrate index
+_BITRATES_MPEG1 = [0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320]
+_BITRATES_MPEG2 = [0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160]
+
+# Consecutive chained headers required before a sync match is trusted
+_SYNC_FRAMES = 3
+
+# Longest possible Layer III frame (320 kbps at 32 kHz, or 160 kbps at 8 kHz)
+_MAX_FRAME_LENGTH = 1441
+
+# Bytes from the end of the data within which a sync candidate may still
+# be waiting for its chained headers; anything earlier is already decided
+SYNC_SPAN = _SYNC_FRAMES * _MAX_FRAME_LENGTH
+
+# Sample rates keyed by the header's 2-bit version id
+_SAMPLE_RATES = {
+    3: [44100, 48000, 32000],  # MPEG-1
+    2: [22050, 24000, 16000],  # MPEG-2
+    0: [11025, 12000, 8000],   # MPEG-2.5
+}
+
+def _parse_header(data, pos: int) -> Optional[tuple]:
+    """Return (frame_length, samples_per_frame, sample_rate, side_info_size) or None."""
+    if pos + 4 > len(data):
+        return None
+    b1, b2, b3 = data[pos + 1], data[pos + 2], data[pos + 3]
+    if data[pos] != 0xFF or (b1 & 0xE0) != 0xE0:
+        return None
+    
+    version = (b1 >> 3) & 0x03
+    layer = (b1 >> 1) & 0x03
+    bitrate_index = b2 >> 4
+    rate_index = (b2 >> 2) & 0x03
+    if version == 1 or layer != 1 or bitrate_index in (0, 15) or rate_index == 3:
+        return None
+    
+    padding = (b2 >> 1) & 0x01
+    mono = (b3 >> 6) == 3
+    sample_rate = _SAMPLE_RATES[version][rate_index]
+    if version == 3:
+        bitrate = _BITRATES_MPEG1[bitrate_index] * 1000
+        return 144 * bitrate // sample_rate + padding, 1152, sample_rate, 17 if mono else 32
+    
+    bitrate = _BITRATES_MPEG2[bitrate_index] * 1000
+    return 72 * bitrate // sample_rate + padding, 576, sample_rate, 9 if mono else 17
+
+def _headers_chain(data, pos: int, count: int) -> Optional[bool]:
+    """Whether count frame headers follow each other from pos, or None if data ends first."""
+    header = _parse_header(data, pos)
+    if header is None:
+        return False
+    
+    sample_rate = header[2]
+    for _ in range(count - 1):
+        pos += header[0]
+        if pos + 4 > len(data):
+            return None
+        header = _parse_header(data, pos)
+        if header is None or header[2] != sample_rate:
+            return False
+    return True
+
+def _side_info_pos(data, pos: int) -> int:
+    """Return the offset of a frame's side info, after the header and optional CRC."""
+    return pos + 4 + (0 if data[pos + 1] & 0x01 else 2)
+
+def _main_data_begin(data, pos: int) -> int:
+    """Return how many bytes back, into earlier frames, a frame's audio data starts."""
+    side_info = _side_info_pos(data, pos)
+    if (data[pos + 1] >> 3) & 0x03 == 3:
+        # MPEG-1: 9-bit pointer
+        return (data[side_info] << 1) | (data[side_info + 1] >> 7)
+    return data[side_info]
+
+def _main_data_size(data, pos: int) -> int:
+    """Return how many bytes of audio data a frame itself holds."""
+    frame_length, _, _, side_info_size = _parse_header(data, pos)
+    return frame_length - (_side_info_pos(data, pos) - pos) - side_info_size
+
+def _skip_id3v2(data) -> int:
+    """Return the offset of the first byte after a leading ID3v2 tag."""
+    if len(data) < 10 or data[:3] != b"ID3":
+        return 0
+    size = (data[6] << 21) | (data[7] << 14) | (data[8] << 7) | data[9]
+    footer = 10 if data[5] & 0x10 else 0
+    return 10 + size + footer
+
+class Mp3FrameIndex:
+    """Byte offsets and start times of the audio frames in an MP3 stream."""
+    
+    def __init__(self, data, offsets: List[int], times_ms: List[float]):
+        self.data = data
+        # offsets/times_ms hold one entry per frame plus a final end marker
+        self.offsets = offsets
+        self.times_ms = times_ms
+    
+    @classmethod
+    def build(cls, data) -> Optional["Mp3FrameIndex"]:
+        """Index the MPEG Layer III frames in data, or return None if there are none."""
+        offsets = []
+        times_ms = []
+        pos = _skip_id3v2(data)
+        elapsed_ms = 0.0
+        locked = False
+        
+        while pos < len(data):
+            if not locked:
+                # Jump to the next sync candidate, then only trust it once
+                # several headers chain from it
+                pos = data.find(b"\xff", pos)
+                if pos < 0:
+                    break
+                chained = _headers_chain(data, pos, _SYNC_FRAMES)
+                if chained is None:
+                    break
+                if not chained:
+                    pos += 1
+                    continue
+                locked = True
+            
+            header = _parse_header(data, pos)
+            if header is None:
+                # Trailing ID3v1 tag, or junk between frames: resync
+                if data[pos:pos + 3] == b"TAG":
+                    break
+                locked = False
+                continue
+            
+            frame_length, samples_per_frame, sample_rate, side_info_size = header
+            if pos + frame_length > len(data):
+                break
+            
+            # The Xing/Info header frame carries metadata, not audio
+            tag_pos = pos + 4 + side_info_size
+            if not offsets and data[tag_pos:tag_pos + 4] in (b"Xing", b"Info"):
+                pos += frame_length
+                continue
+            
+            offsets.append(pos)
+            times_ms.append(elapsed_ms)
+            elapsed_ms += samples_per_frame * 1000.0 / sample_rate
+            pos += frame_length
+        
+        if not offsets:
+            return None
+        
+        end = offsets[-1] + _parse_header(data, offsets[-1])[0]
+        offsets.append(end)
+        times_ms.append(elapsed_ms)
+        return cls(data, offsets, times_ms)
+    
+    def slice(self, start_ms: float, end_ms: float) -> bytes:
+        """Return the encoded frames covering [start_ms, end_ms).
+        
+        Layer III frames may start their audio data in earlier frames (the
+        bit reservoir), so the frames that data lives in are prepended as
+        guard frames and decode as a few extra ms of lead-in. Times are not
+        corrected for the encoder delay, which shifts cuts by some 25 ms.
+        """
+        first = max(bisect.bisect_right(self.times_ms, start_ms) - 1, 0)
+        last = min(bisect.bisect_left(self.times_ms, end_ms), len(self.offsets) - 1)
+        last = max(last, first + 1)
+        
+        # Walk back until the reservoir bytes of the first frame are included
+        needed = _main_data_begin(self.data, self.offsets[first])
+        while needed > 0 and first > 0:
+            first -= 1
+            needed -= _main_data_size(self.data, self.offsets[first])
+        
+        return bytes(self.data[self.offsets[first]:self.offsets[last]])
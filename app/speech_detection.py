@@ -0,0 +1,220 @@
+import math
+import os
+from pathlib import Path
+from typing import List, Tuple, Optional
+
+import numpy as np
+import soundfile
+from scipy.signal import resample_poly
+
+from .config import (
+    SAMPLE_RATE,
+    SILENCE_THRESHOLD,
+    SENTENCE_MIN_LENGTH,
+    SENTENCE_MAX_LENGTH,
+    AUDIO_PROCESS_WORKERS,
+    DECODE_BLOCK_FRAMES
+)
+
+try:
+    import numba
+    # Kernels are launched from executor threads; the TBB layer can hang at
+    # interpreter exit once other threads have been started after it
+    numba.config.THREADING_LAYER_PRIORITY = ["omp", "tbb", "workqueue"]
+except ImportError:  # fall back to the NumPy scan
+    numba = None
+
+def _ms_energy_numpy(samples: np.ndarray, samples_per_ms: int) -> np.ndarray:
+    """Sum of squared samples for every whole millisecond (exact int64 sums)."""
+    n_ms = len(samples) // samples_per_ms
+    blocks = samples[:n_ms * samples_per_ms].reshape(n_ms, samples_per_ms)
+    # einsum widens the int16 samples in small buffered chunks, so unlike
+    # astype() no full-size copy of the signal is made
+    return np.einsum("ij,ij->i", blocks, blocks, dtype=np.int64)
+
+def _silent_window_mask_numpy(energy: np.ndarray, window_ms: int, thresh_energy: float) -> np.ndarray:
+    """Mark every window_ms window start (1 ms step) whose energy is <= thresh_energy."""
+    # Rolling window energy via an exact integer cumulative sum of squares;
+    # window sums are integers, so comparing against the floored threshold
+    # is the same test
+    csum = np.zeros(len(energy) + 1, dtype=np.int64)
+    np.cumsum(energy, dtype=np.int64, out=csum[1:])
+    return csum[window_ms:] - csum[:-window_ms] <= math.floor(thresh_energy)
+
+if numba is not None:
+    @numba.njit(parallel=True, cache=True)
+    def _ms_energy_numba(samples, samples_per_ms):
+        """Parallel JIT version of _ms_energy_numpy (exact int64 sums)."""
+        n_ms = samples.shape[0] // samples_per_ms
+        energy = np.empty(n_ms, dtype=np.int64)
+        for i in numba.prange(n_ms):
+            acc = 0
+            base = i * samples_per_ms
+            for j in range(samples_per_ms):
+                value = np.int64(samples[base + j])
+                acc += value * value
+            energy[i] = acc
+        return energy
+    
+    @numba.njit(parallel=True, fastmath=True, cache=True)
+    def _silent_window_mask_kernel(energy, window_ms, thresh_energy, n_blocks):
+        n_windows = energy.shape[0] - window_ms + 1
+        
+        # Slide the window independently over contiguous blocks of starts
+        n_blocks = max(1, min(n_blocks, n_windows // window_ms))
+        block = (n_windows + n_blocks - 1) // n_blocks
+        mask = np.empty(max(n_windows, 0), dtype=np.bool_)
+        for b in numba.prange(n_blocks):
+            start = b * block
+            stop = min(start + block, n_windows)
+            if start >= stop:
+                continue
+            acc = 0
+            for k in range(start, start + window_ms):
+                acc += energy[k]
+            for i in range(start, stop):
+                mask[i] = acc <= thresh_energy
+                if i + 1 < stop:
+                    acc += energy[i + window_ms] - energy[i]
+        return mask
+    
+    def _silent_window_mask_numba(energy: np.ndarray, window_ms: int, thresh_energy: float) -> np.ndarray:
+        """Parallel JIT version of _silent_window_mask_numpy."""
+        return _silent_window_mask_kernel(
+            energy, window_ms, float(thresh_energy), numba.get_num_threads() * 4
+        )
+    
+    _ms_energy = _ms_energy_numba
+    _silent_window_mask = _silent_window_mask_numba
+else:
+    _ms_energy = _ms_energy_numpy
+    _silent_window_mask = _silent_window_mask_numpy
+
+def _downmix(frames: np.ndarray) -> np.ndarray:
+    """Average int16 frames down to one int16 channel."""
+    if frames.shape[1] == 1:
+        return frames[:, 0]
+    return (frames.sum(axis=1, dtype=np.int32) // frames.shape[1]).astype(np.int16)
+
+def _resample(samples: np.ndarray, sample_rate: int) -> np.ndarray:
+    """Resample mono int16 samples to SAMPLE_RATE."""
+    if sample_rate == SAMPLE_RATE:
+        return samples
+    divisor = math.gcd(sample_rate, SAMPLE_RATE)
+    up, down = SAMPLE_RATE // divisor, sample_rate // divisor
+    
+    # Filter in float one block at a time. Blocks start on multiples of down,
+    # so each maps to a whole output sample, and carry enough neighbouring
+    # input for resample_poly's filter (10 * max(up, down) taps each side
+    # at the upsampled rate) to give the same result as one long call
+    step = down * max(1, DECODE_BLOCK_FRAMES // down)
+    pad = down * math.ceil((10 * max(up, down) // up + 1) / down)
+    out = np.empty(-(-len(samples) * up // down), dtype=np.int16)
+    for start in range(0, len(samples), step):
+        lo = max(start - pad, 0)
+        block = resample_poly(samples[lo:min(start + step + pad, len(samples))], up, down)
+        first = start * up // down
+        count = min(step * up // down, len(out) - first)
+        skip = (start - lo) * up // down
+        np.clip(block[skip:skip + count], -32768, 32767, out=block[skip:skip + count])
+        out[first:first + count] = block[skip:skip + count]
+    return out
+
+def to_mono_int16(frames: np.ndarray, sample_rate: int) -> np.ndarray:
+    """Downmix int16 frames to mono and resample them to SAMPLE_RATE."""
+    return _resample(_downmix(frames), sample_rate)
+
+def is_sentence_length(samples: np.ndarray) -> bool:
+    """Whether a segment is neither too short nor too long to be a sentence."""
+    duration_seconds = len(samples) / SAMPLE_RATE
+    return SENTENCE_MIN_LENGTH <= duration_seconds <= SENTENCE_MAX_LENGTH
+
+def load_audio(file_path: Path) -> np.ndarray:
+    """Load audio file as mono int16 samples at SAMPLE_RATE."""
+    # Decode straight to int16 and downmix block by block, so only the mono
+    # signal is ever held whole. For MP3 the frame count is an upper
+    # estimate, so keep only what actually decodes
+    with soundfile.SoundFile(str(file_path)) as audio_file:
+        samples = np.empty(max(audio_file.frames, 0), dtype=np.int16)
+        length = 0
+        while True:
+            frames = audio_file.read(DECODE_BLOCK_FRAMES, dtype="int16", always_2d=True)
+            if not len(frames):
+                break
+            samples[length:length + len(frames)] = _downmix(frames)
+            length += len(frames)
+        sample_rate = audio_file.samplerate
+    return _resample(samples[:length], sample_rate)
+
+def detect_speech_segments(samples: np.ndarray, mean_square: Optional[float] = None) -> List[Tuple[int, int]]:
+    """Detect non-silent segments in audio.
+    
+    mean_square is the loudness the silence threshold is relative to,
+    by default that of samples itself.
+    """
+    samples_per_ms = SAMPLE_RATE // 1000
+    duration_ms = round(len(samples) / samples_per_ms)
+    
+    # Audio shorter than the silence window cannot contain a silent section
+    if duration_ms < SILENCE_THRESHOLD:
+        return [(0, duration_ms)]
+    
+    energy = _ms_energy(samples, samples_per_ms)
+    n_ms = len(energy)
+    
+    # Same threshold pydub uses: 16 dB below the average loudness,
+    # expressed as the energy of a whole window
+    window = SILENCE_THRESHOLD
+    if mean_square is None:
+        mean_square = float(energy.sum()) / (n_ms * samples_per_ms)
+    thresh_energy = mean_square * 10 ** (-16 / 10) * window * samples_per_ms
+    
+    # Windows start on every millisecond, the same seek step pydub uses
+    silent_starts = np.flatnonzero(_silent_window_mask(energy, window, thresh_energy))
+    
+    # A millisecond is silent if any silent window covers it
+    coverage = np.zeros(n_ms + 1, dtype=np.int32)
+    coverage[silent_starts] += 1
+    coverage[silent_starts + window] -= 1
+    voiced = np.cumsum(coverage[:-1]) == 0
+    
+    # Turn runs of voiced milliseconds into [start, end) ranges
+    edges = np.diff(np.concatenate(([0], voiced.view(np.int8), [0])))
+    starts = np.flatnonzero(edges == 1)
+    ends = np.flatnonzero(edges == -1)
+    
+    ranges = [(int(start), int(end)) for start, end in zip(starts, ends)]
+    if ranges and ranges[-1][1] == n_ms:
+        ranges[-1] = (ranges[-1][0], duration_ms)
+    return ranges
+
+def slice_speech_segments(samples: np.ndarray, speech_ranges: List[Tuple[int, int]]) -> List[Tuple[Tuple[int, int], np.ndarray]]:
+    """Slice speech ranges out of audio, keeping sentence-sized segments."""
+    samples_per_ms = SAMPLE_RATE // 1000
+    segments = []
+    
+    for start_ms, end_ms in speech_ranges:
+        # Extract audio segment (a view, no copy)
+        segment_samples = samples[start_ms * samples_per_ms:end_ms * samples_per_ms]
+        
+        # Skip very short or very long segments
+        if not is_sentence_length(segment_samples):
+            continue
+        
+        segments.append(((start_ms, end_ms), segment_samples))
+    
+    return segments
+
+def init_worker() -> None:
+    """Set up a cpu_pool process."""
+    # Every worker runs its own kernels, so split the cores between them
+    # instead of starting a full thread pool in each
+    if numba is not None:
+        numba.set_num_threads(max(1, (os.cpu_count() or 1) // AUDIO_PROCESS_WORKERS))
+
+def load_and_detect(file_path: Path) -> List[Tuple[Tuple[int, int], np.ndarray]]:
+    """Load audio and slice out its sentence segments; runs in a cpu_pool process."""
+    samples = load_audio(file_path)
+    # Views pickle only their own samples, so just the sentence audio that
+    # transcription needs goes back to the parent, not the whole decoding
+    return slice_speech_segments(samples, detect_speech_segments(samples))
@@ -1,4 +1,5 @@
 import pytest
+import pytest_asyncio
 import asyncio
 from fastapi.testclient import TestClient
 from app.main import app
@@ -12,10 +13,11 @@ def client():
     """Create test client."""
     return TestClient(app)
 
-@pytest.fixture
+@pytest_asyncio.fixture
 async def setup_db():
     """Setup test database."""
     # Use temporary database for testing
+    original_db_path = db_manager.db_path
     test_db_path = tempfile.mktemp(suffix=".db")
     db_manager.db_path = test_db_path
     
@@ -24,8 +26,11 @@ async def setup_db():
     yield
     
     # Cleanup
-    if os.path.exists(test_db_path):
-        os.unlink(test_db_path)
+    await db_manager.close()
+    db_manager.db_path = original_db_path
+    for path in (test_db_path, test_db_path + "-wal", test_db_path + "-shm"):
+        if os.path.exists(path):
+            os.unlink(path)
 
 @pytest.fixture
 def sample_mp3_data():
@@ -65,10 +70,10 @@ async def test_upload_valid_file(client, setup_db, sample_mp3_data):
     with patch('app.main.audio_processor.process_audio_file') as mock_process:
         from app.models import AudioSegment
         from datetime import datetime
-        import hashlib
+        from blake3 import blake3
         
         # Calculate actual hash of sample data
-        file_hash = hashlib.sha256(sample_mp3_data).hexdigest()
+        file_hash = blake3(sample_mp3_data).hexdigest()
         
         # Create mock AudioSegment object
         mock_segment = AudioSegment(
@@ -100,9 +105,57 @@ def test_get_segments_not_found(client):
     assert response.status_code == 404
     assert "No segments found" in response.json()["detail"]
 
+def test_download_segment_caching(client, tmp_path):
+    """Test segment download sets cache headers and honours If-None-Match."""
+    from unittest.mock import AsyncMock
+    from app.models import AudioSegment
+    from datetime import datetime
+    
+    file_hash = "a" * 64
+    segment_file = tmp_path / "segment_0001.mp3"
+    segment_file.write_bytes(b"mock_audio_data")
+    segment = AudioSegment(
+        id=1,
+        file_hash=file_hash,
+        timestamp=datetime.now(),
+        filename_sequence=1,
+        length_seconds=5.0,
+        text_content="Test transcription",
+        file_path=str(segment_file)
+    )
+    
+    with patch('app.main.db_manager.get_segment_by_hash_and_sequence', new=AsyncMock(return_value=segment)):
+        response = client.get(f"/segments/{file_hash}/1")
+        assert response.status_code == 200
+        assert response.content == b"mock_audio_data"
+        etag = response.headers["etag"]
+        assert "no-cache" in response.headers["cache-control"]
+        
+        response = client.get(f"/segments/{file_hash}/1", headers={"If-None-Match": etag})
+        assert response.status_code == 304
+        
+        # New content behind the same URL gets a new validator
+        segment_file.write_bytes(b"replacement_audio_data")
+        response = client.get(f"/segments/{file_hash}/1", headers={"If-None-Match": etag})
+        assert response.status_code == 200
+        assert response.headers["etag"] != etag
+
 def test_websocket_connection():
     """Test WebSocket connection."""
     with TestClient(app) as client:
         with client.websocket_connect("/stream") as websocket:
             # Connection should be established
             assert websocket is not None
+
+def test_websocket_sessions_get_distinct_ids():
+    """Test streams starting with identical chunks are stored apart."""
+    stream_ids = []
+    with TestClient(app) as client:
+        for _ in range(2):
+            with client.websocket_connect("/stream") as websocket:
+                websocket.send_bytes(b"ID3 shared header")
+                status = websocket.receive_json()
+                assert status["status"] == "processed"
+                stream_ids.append(status["current_file_hash"])
+    
+    assert stream_ids[0] != stream_ids[1]
@@ -12,7 +12,8 @@ def audio_processor():
 def test_audio_processor_initialization(audio_processor):
     """Test audio processor initialization."""
     assert audio_processor.recognizer is not None
-    assert audio_processor.executor is not None
+    assert audio_processor.cpu_pool is not None
+    assert audio_processor.io_pool is not None
 
 def test_calculate_hash_consistency():
     """Test hash calculation consistency."""
@@ -23,7 +24,7 @@ def test_calculate_hash_consistency():
     hash2 = file_manager.calculate_hash(data)
     
     assert hash1 == hash2
-    assert len(hash1) == 64  # SHA-256 hex length
+    assert len(hash1) == 64  # BLAKE3 hex length
 
 @pytest.mark.asyncio
 async def test_process_invalid_audio_file(audio_processor):
@@ -40,11 +41,129 @@ async def test_process_invalid_audio_file(audio_processor):
     finally:
         os.unlink(temp_path)
 
+def _exit_worker(file_path):
+    """Stand-in for load_and_detect that kills its worker process."""
+    os._exit(1)
+
+@pytest.mark.asyncio
+async def test_broken_cpu_pool_is_replaced(audio_processor):
+    """Test a dead worker fails only its own request."""
+    from unittest.mock import patch
+    from concurrent.futures.process import BrokenProcessPool
+    
+    broken_pool = audio_processor.cpu_pool
+    with patch("app.audio_processor.load_and_detect", _exit_worker):
+        with pytest.raises(BrokenProcessPool):
+            await audio_processor.process_audio_file(Path("unused.mp3"), "test_hash")
+    
+    assert audio_processor.cpu_pool is not broken_pool
+    assert audio_processor.cpu_pool.submit(abs, -1).result() == 1
+
 def test_transcribe_empty_audio(audio_processor):
     """Test transcribing empty audio data."""
-    result = audio_processor._transcribe_audio_segment(b"")
+    import numpy as np
+    
+    result = audio_processor._transcribe_audio_segment(np.array([], dtype=np.int16))
     assert result is None
 
+def test_transcription_cache(audio_processor):
+    """Test identical audio is only sent for recognition once."""
+    import numpy as np
+    from unittest.mock import patch
+    
+    segment = np.zeros(16000, dtype=np.int16)
+    
+    with patch.object(audio_processor.recognizer, 'recognize_google', return_value="Hello.") as mock_recognize:
+        assert audio_processor._transcribe_audio_segment(segment) == "Hello."
+        assert audio_processor._transcribe_audio_segment(segment) == "Hello."
+    
+    assert mock_recognize.call_count == 1
+
+def test_encode_mp3(audio_processor):
+    """Test segments are encoded in-process as MP3 frames."""
+    import numpy as np
+    from app.mp3_frames import Mp3FrameIndex
+    
+    samples = (np.random.default_rng(0).standard_normal(16000 * 2) * 8000).astype(np.int16)
+    mp3_data = audio_processor._encode_mp3(samples)
+    
+    frame_index = Mp3FrameIndex.build(mp3_data)
+    assert frame_index is not None
+    assert abs(frame_index.times_ms[-1] - 2000) < 200
+
+def test_detect_speech_segments(audio_processor):
+    """Test speech detection on synthetic tone/silence audio."""
+    import numpy as np
+    
+    # 1s of noise, 1s of near-silence, 1s of noise at 16 kHz
+    rng = np.random.default_rng(0)
+    loud = (rng.standard_normal(16000) * 8000).astype(np.int16)
+    quiet = (rng.standard_normal(16000) * 10).astype(np.int16)
+    samples = np.concatenate([loud, quiet, loud])
+    
+    ranges = audio_processor._detect_speech_segments(samples)
+    
+    assert len(ranges) == 2
+    (start1, end1), (start2, end2) = ranges
+    assert start1 == 0 and abs(end1 - 1000) < 20
+    assert abs(start2 - 2000) < 20 and end2 == 3000
+
+def test_stream_segments_across_chunks(audio_processor):
+    """Test speech split over stream chunks is cut once silence follows."""
+    lameenc = pytest.importorskip("lameenc")
+    import numpy as np
+    from app.audio_processor import StreamState
+    
+    rng = np.random.default_rng(0)
+    noise = lambda seconds: (rng.standard_normal(16000 * seconds) * 8000).astype(np.int16)
+    silence = np.zeros(16000, dtype=np.int16)
+    pcm = np.concatenate([noise(2), silence, noise(2), silence, noise(2)])
+    
+    encoder = lameenc.Encoder()
+    encoder.set_bit_rate(64)
+    encoder.set_in_sample_rate(16000)
+    encoder.set_channels(1)
+    mp3_data = encoder.encode(pcm.tobytes()) + encoder.flush()
+    
+    state = StreamState()
+    segments = []
+    for i in range(0, len(mp3_data), 3000):
+        segments += audio_processor._feed_stream(state, mp3_data[i:i + 3000])
+    assert len(segments) == 2
+    
+    # The last speech has no silence after it until the stream ends
+    segments += audio_processor._take_stream_segments(state, final=True)
+    assert len(segments) == 3
+    for segment in segments:
+        assert abs(len(segment) / 16000 - 2) < 0.1
+
+def test_stream_drops_unsynced_input(audio_processor):
+    """Test non-MP3 stream input is not buffered without bound."""
+    lameenc = pytest.importorskip("lameenc")
+    import numpy as np
+    from app.audio_processor import StreamState
+    from app.mp3_frames import SYNC_SPAN
+    
+    # 60s of raw 16 kHz PCM, which never syncs as MP3
+    rng = np.random.default_rng(0)
+    pcm_data = (rng.standard_normal(16000 * 60) * 8000).astype(np.int16).tobytes()
+    
+    state = StreamState()
+    for i in range(0, len(pcm_data), 3000):
+        assert audio_processor._feed_stream(state, pcm_data[i:i + 3000]) == []
+        assert len(state.pending) <= SYNC_SPAN + 3000
+    
+    # MP3 frames sent after the junk are still found and decoded
+    encoder = lameenc.Encoder()
+    encoder.set_bit_rate(64)
+    encoder.set_in_sample_rate(16000)
+    encoder.set_channels(1)
+    mp3_data = encoder.encode(np.frombuffer(pcm_data[:16000 * 2 * 2], dtype=np.int16).tobytes()) + encoder.flush()
+    audio_processor._feed_stream(state, mp3_data)
+    segments = audio_processor._take_stream_segments(state, final=True)
+    assert len(segments) == 1
+    assert abs(len(segments[0]) / 16000 - 2) < 0.1
+
 def test_detect_speech_segments_invalid_audio(audio_processor):
     """Test speech detection with invalid audio."""
     # This test would need a proper audio segment to work
@@ -0,0 +1,37 @@
+import pytest
+from app.buffer_pool import BufferPool
+
+@pytest.fixture
+def buffer_pool():
+    """Create buffer pool capped at 1MB buffers."""
+    return BufferPool(max_size=1024 * 1024, max_free=2)
+
+def test_get_rounds_up_to_size_class(buffer_pool):
+    """Test buffers are sized to the next power of two."""
+    assert len(buffer_pool.get(1000)) == 1024
+    assert len(buffer_pool.get(1024)) == 1024
+    assert len(buffer_pool.get(1025)) == 2048
+
+def test_buffer_is_reused(buffer_pool):
+    """Test returned buffers are handed out again."""
+    with buffer_pool.buffer(4096) as first:
+        pass
+    with buffer_pool.buffer(3000) as second:
+        assert second is first
+
+def test_oversized_buffer_not_pooled(buffer_pool):
+    """Test buffers above the largest size class bypass the pool."""
+    large = buffer_pool.get(2 * 1024 * 1024)
+    assert len(large) == 2 * 1024 * 1024
+    
+    buffer_pool.put(large)
+    assert buffer_pool.get(2 * 1024 * 1024) is not large
+
+def test_free_list_is_bounded(buffer_pool):
+    """Test each size class keeps at most max_free buffers."""
+    buffers = [buffer_pool.get(512) for _ in range(3)]
+    for buf in buffers:
+        buffer_pool.put(buf)
+    
+    reused = [buffer_pool.get(512) for _ in range(3)]
+    assert sum(any(buf is r for r in reused) for buf in buffers) == 2
@@ -0,0 +1,81 @@
+import pytest
+import pytest_asyncio
+from datetime import datetime
+from app.database import DatabaseManager
+from app.models import AudioSegment
+
+@pytest_asyncio.fixture
+async def db(tmp_path):
+    """Create database manager backed by a temporary database."""
+    manager = DatabaseManager(str(tmp_path / "test.db"))
+    await manager.init_db()
+    yield manager
+    await manager.close()
+
+def make_segment(file_hash: str, sequence: int) -> AudioSegment:
+    """Create an unsaved segment for a hash and sequence number."""
+    return AudioSegment(
+        file_hash=file_hash,
+        timestamp=datetime.now(),
+        filename_sequence=sequence,
+        length_seconds=2.5,
+        text_content=f"Sentence {sequence}.",
+        file_path=f"/segments/{file_hash}/segment_{sequence:04d}.mp3"
+    )
+
+@pytest.mark.asyncio
+async def test_insert_segments_many(db):
+    """Test batch insert stores every segment in sequence order."""
+    await db.insert_segments_many([make_segment("a" * 64, i) for i in (2, 0, 1)])
+    
+    segments = await db.get_segments_by_hash("a" * 64)
+    
+    assert [segment.filename_sequence for segment in segments] == [0, 1, 2]
+    assert segments[1].text_content == "Sentence 1."
+
+@pytest.mark.asyncio
+async def test_get_segment_by_hash_and_sequence(db):
+    """Test single segment lookup by hash and sequence."""
+    await db.insert_segments_many([make_segment("a" * 64, 0), make_segment("b" * 64, 0)])
+    
+    segment = await db.get_segment_by_hash_and_sequence("b" * 64, 0)
+    
+    assert segment is not None
+    assert segment.file_hash == "b" * 64
+    assert await db.get_segment_by_hash_and_sequence("b" * 64, 1) is None
+
+@pytest.mark.asyncio
+async def test_insert_replaces_same_sequence(db):
+    """Test re-inserting a (hash, sequence) pair replaces the stored segment."""
+    await db.insert_segments_many([make_segment("a" * 64, 0)])
+    
+    replacement = make_segment("a" * 64, 0)
+    replacement.text_content = "Replacement."
+    await db.insert_segments_many([replacement])
+    
+    segments = await db.get_segments_by_hash("a" * 64)
+    assert len(segments) == 1
+    assert segments[0].text_content == "Replacement."
+
+@pytest.mark.asyncio
+async def test_init_db_removes_duplicate_sequences(tmp_path):
+    """Test init_db keeps the newest row of each duplicated (hash, sequence) pair."""
+    manager = DatabaseManager(str(tmp_path / "legacy.db"))
+    await manager.init_db()
+    
+    # Recreate a database from before the unique index, with a duplicate
+    db = await manager._connect()
+    await db.execute("DROP INDEX idx_hash_seq_unique")
+    for text in ("Old.", "New."):
+        await db.execute("""
+            INSERT INTO audio_segments 
+            (file_hash, timestamp, filename_sequence, length_seconds, text_content, file_path)
+            VALUES (?, ?, 0, 1.0, ?, '')
+        """, ("a" * 64, datetime.now(), text))
+    await db.commit()
+    
+    await manager.init_db()
+    segments = await manager.get_segments_by_hash("a" * 64)
+    await manager.close()
+    
+    assert [segment.text_content for segment in segments] == ["New."]
@@ -4,6 +4,16 @@ import os
 from pathlib import Path
 from app.file_manager import FileManager
 
+def _fast_rmtree(root):
+    """Recursively delete a directory using the entry types scandir returns."""
+    with os.scandir(root) as entries:
+        for entry in entries:
+            if entry.is_dir(follow_symlinks=False):
+                _fast_rmtree(entry.path)
+            else:
+                os.unlink(entry.path)
+    os.rmdir(root)
+
 @pytest.fixture
 def temp_dir():
     """Create temporary directory for testing."""
@@ -11,8 +21,7 @@ def temp_dir():
     yield temp_dir
     
     # Cleanup
-    import shutil
-    shutil.rmtree(temp_dir)
+    _fast_rmtree(temp_dir)
 
 @pytest.fixture
 def file_manager(temp_dir):
@@ -25,7 +34,7 @@ def test_calculate_hash(file_manager):
     hash_result = file_manager.calculate_hash(data)
     
     assert isinstance(hash_result, str)
-    assert len(hash_result) == 64  # SHA-256 hex string
+    assert len(hash_result) == 64  # BLAKE3 hex string
     
     # Same data should produce same hash
     hash_result2 = file_manager.calculate_hash(data)
@@ -47,6 +56,25 @@ async def test_calculate_hash_from_file(file_manager, temp_dir):
     
     assert file_hash == direct_hash
 
+@pytest.mark.asyncio
+async def test_calculate_hash_from_empty_file(file_manager, temp_dir):
+    """Test hash calculation from an empty file."""
+    test_file = temp_dir / "empty.txt"
+    test_file.touch()
+    
+    file_hash = await file_manager.calculate_hash_from_file(test_file)
+    
+    assert file_hash == file_manager.calculate_hash(b"")
+
+def test_hash_stream_across_chunks(file_manager, temp_dir):
+    """Test chunked hashing matches hashing the data at once."""
+    test_data = os.urandom(2 * 1024 * 1024 + 123)
+    test_file = temp_dir / "large.bin"
+    test_file.write_bytes(test_data)
+    
+    with open(test_file, 'rb') as f:
+        assert file_manager._digest_stream(f) == file_manager._digest(test_data)
+
 def test_get_segment_dir(file_manager):
     """Test segment directory creation."""
     test_hash = "abcdef1234567890" * 4  # 64 character hash
@@ -74,6 +102,17 @@ async def test_save_segment(file_manager):
     with open(file_path, 'rb') as f:
         assert f.read() == test_data
 
+@pytest.mark.asyncio
+async def test_save_segment_after_dir_removed(file_manager):
+    """Test saving recreates a cached segment directory that was removed."""
+    test_hash = "b" * 64
+    
+    await file_manager.save_segment(test_hash, 0, b"first")
+    _fast_rmtree(file_manager.get_segment_dir(test_hash))
+    
+    file_path = await file_manager.save_segment(test_hash, 1, b"second")
+    assert file_path.read_bytes() == b"second"
+
 @pytest.mark.asyncio
 async def test_save_temp_file(file_manager):
     """Test saving temporary file."""
@@ -88,6 +127,28 @@ async def test_save_temp_file(file_manager):
     with open(temp_path, 'rb') as f:
         assert f.read() == test_data
 
+@pytest.mark.asyncio
+async def test_save_temp_file_from_fd(file_manager, temp_dir):
+    """Test saving temporary file from a file descriptor."""
+    test_data = os.urandom(3 * 1024 * 1024)
+    source_file = temp_dir / "source.bin"
+    source_file.write_bytes(b"header" + test_data)
+    
+    with open(source_file, 'rb') as f:
+        f.seek(len(b"header"))
+        temp_path = await file_manager.save_temp_file_from_fd(f.fileno(), len(test_data))
+    
+    assert temp_path.suffix == ".mp3"
+    assert temp_path.read_bytes() == test_data
+
+@pytest.mark.asyncio
+async def test_save_temp_file_from_fd_failure(file_manager):
+    """Test a failed copy removes its partial temporary file."""
+    with pytest.raises(OSError):
+        await file_manager.save_temp_file_from_fd(-1, 1024)
+    
+    assert list(file_manager.get_temp_dir().iterdir()) == []
+
 def test_verify_file_integrity(file_manager, temp_dir):
     """Test file integrity verification."""
     test_data = b"integrity test data"
@@ -111,6 +172,31 @@ def test_verify_file_integrity(file_manager, temp_dir):
     fake_file = temp_dir / "nonexistent.txt"
     assert not file_manager.verify_file_integrity(fake_file, expected_hash)
 
+def test_verify_many(file_manager, temp_dir):
+    """Test verifying several files at once."""
+    files_and_hashes = []
+    for i in range(4):
+        test_data = f"segment {i}".encode()
+        test_file = temp_dir / f"segment_{i}.mp3"
+        test_file.write_bytes(test_data)
+        files_and_hashes.append((test_file, file_manager.calculate_hash(test_data)))
+    
+    # Corrupt one file
+    files_and_hashes[2][0].write_bytes(b"corrupted")
+    
+    assert file_manager.verify_many(files_and_hashes) == [True, True, False, True]
+
+def test_verify_unreadable_paths(file_manager, temp_dir):
+    """Test unreadable paths fail verification instead of raising."""
+    test_file = temp_dir / "integrity_test.txt"
+    test_file.write_bytes(b"integrity test data")
+    expected_hash = file_manager.calculate_hash(b"integrity test data")
+    
+    # A regular file used as a directory raises NotADirectoryError on stat
+    not_a_dir = test_file / "segment.mp3"
+    assert not file_manager.verify_file_integrity(not_a_dir, expected_hash)
+    assert file_manager.verify_many([(test_file, expected_hash), (not_a_dir, expected_hash)]) == [True, False]
+
 @pytest.mark.asyncio
 async def test_cleanup_temp_files(file_manager):
     """Test cleanup of temporary files."""
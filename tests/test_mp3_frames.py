@@ -0,0 +1,63 @@
+import pytest
+from app.mp3_frames import Mp3FrameIndex
+
+# MPEG-1 Layer III, 128 kbps, 44.1 kHz, no padding: 417-byte frames
+FRAME_HEADER = b'\xff\xfb\x90\x00'
+FRAME_LENGTH = 417
+FRAME_MS = 1152 * 1000.0 / 44100
+SIDE_INFO_SIZE = 32  # stereo MPEG-1
+
+def make_frame(payload: int, main_data_begin: int = 0) -> bytes:
+    """Create a frame whose audio data is filled with payload."""
+    side_info = bytes([main_data_begin >> 1, (main_data_begin & 1) << 7]) + b'\x00' * (SIDE_INFO_SIZE - 2)
+    return FRAME_HEADER + side_info + bytes([payload]) * (FRAME_LENGTH - 4 - SIDE_INFO_SIZE)
+
+@pytest.fixture
+def mp3_data():
+    """Create an ID3-tagged stream of 10 silent frames with distinct payloads."""
+    id3_tag = b'ID3\x03\x00\x00\x00\x00\x00\x05' + b'\x00' * 5
+    frames = b''.join(make_frame(i) for i in range(10))
+    return id3_tag + frames + b'TAG' + b'\x00' * 125
+
+def test_build_index(mp3_data):
+    """Test frames are indexed after the ID3 tag and before the ID3v1 tag."""
+    index = Mp3FrameIndex.build(mp3_data)
+    
+    assert len(index.offsets) == 11
+    assert index.offsets[0] == 15
+    assert index.offsets[-1] == 15 + 10 * FRAME_LENGTH
+    assert index.times_ms[-1] == pytest.approx(10 * FRAME_MS)
+
+def test_build_index_no_frames():
+    """Test non-MP3 data produces no index."""
+    assert Mp3FrameIndex.build(b"invalid audio data") is None
+
+def test_slice_covers_range(mp3_data):
+    """Test slicing returns whole frames covering the requested range."""
+    index = Mp3FrameIndex.build(mp3_data)
+    
+    # 2.5 frames in, 2 frames long: frames 2, 3 and 4
+    data = index.slice(2.5 * FRAME_MS, 4.5 * FRAME_MS)
+    
+    assert len(data) == 3 * FRAME_LENGTH
+    assert data[-1 - (2 * FRAME_LENGTH)] == 2
+    assert data[-1] == 4
+
+def test_slice_includes_bit_reservoir():
+    """Test frames holding the first frame's reservoir data are prepended."""
+    frames = [make_frame(i) for i in range(5)]
+    frames[3] = make_frame(3, main_data_begin=FRAME_LENGTH)
+    index = Mp3FrameIndex.build(b''.join(frames))
+    
+    # Frame 3 starts its data more than one frame back, so 1 and 2 lead in
+    data = index.slice(3.5 * FRAME_MS, 4.5 * FRAME_MS)
+    
+    assert len(data) == 4 * FRAME_LENGTH
+    assert data[-1 - (3 * FRAME_LENGTH)] == 1
+
+def test_build_index_requires_chained_headers():
+    """Test a lone sync match in non-MP3 data is not taken as a frame."""
+    junk = b'\x00' * 100 + FRAME_HEADER + b'\x00' * 1000
+    
+    assert Mp3FrameIndex.build(junk) is None
+    assert Mp3FrameIndex.build(junk + b''.join(make_frame(i) for i in range(3))).offsets[0] == 1104
@@ -0,0 +1,50 @@
+import pytest
+import numpy as np
+import soundfile
+from app.speech_detection import load_and_detect
+
+def test_load_and_detect_returns_sentences_only(tmp_path):
+    """Test the worker sends back sentence audio, not the whole decoding."""
+    # 2s of noise, 1s of near-silence, then a 0.2s blip too short to keep
+    rng = np.random.default_rng(0)
+    loud = rng.standard_normal(16000 * 2) * 0.25
+    quiet = rng.standard_normal(16000) * 0.0003
+    blip = rng.standard_normal(3200) * 0.25
+    audio_path = tmp_path / "speech.wav"
+    soundfile.write(str(audio_path), np.concatenate([loud, quiet, blip]), 16000)
+    
+    segments = load_and_detect(audio_path)
+    
+    assert len(segments) == 1
+    (start_ms, end_ms), samples = segments[0]
+    assert start_ms == 0 and abs(end_ms - 2000) < 20
+    assert samples.dtype == np.int16
+    assert len(samples) == end_ms * 16
+
+def test_resample_in_blocks_matches_whole_signal(monkeypatch):
+    """Test block-wise resampling gives the same samples as one resample_poly call."""
+    from scipy.signal import resample_poly
+    from app import speech_detection as module
+    
+    monkeypatch.setattr(module, "DECODE_BLOCK_FRAMES", 4096)
+    samples = (np.random.default_rng(0).standard_normal(44100 * 2) * 8000).astype(np.int16)
+    
+    expected = np.clip(resample_poly(samples, 160, 441), -32768, 32767).astype(np.int16)
+    assert np.array_equal(module._resample(samples, 44100), expected)
+
+def test_silent_window_mask_backends_agree():
+    """Test the Numba kernel matches the NumPy silence scan."""
+    pytest.importorskip("numba")
+    from app import speech_detection as module
+    
+    rng = np.random.default_rng(0)
+    samples = (rng.standard_normal(16000 * 5) * rng.choice([10, 8000], 16000 * 5)).astype(np.int16)
+    
+    numba_energy = module._ms_energy_numba(samples, 16)
+    numpy_energy = module._ms_energy_numpy(samples, 16)
+    assert np.array_equal(numba_energy, numpy_energy)
+    
+    thresh_energy = 1000.0 ** 2 * 500 * 16
+    numba_mask = module._silent_window_mask_numba(numba_energy, 500, thresh_energy)
+    numpy_mask = module._silent_window_mask_numpy(numba_energy, 500, thresh_energy)
+    assert np.array_equal(numba_mask, numpy_mask)